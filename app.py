@@ -1,39 +1,281 @@
 from flask import Flask, render_template, request, jsonify
+from numba import njit
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
+import functools
+import hashlib
+import os
 import re
+import sys
+import threading
+import time
 from zoneinfo import ZoneInfo
 
 app = Flask(__name__)
 DATA_FILE = "rawData.csv"
+DATA_FILE_PARQ = "rawData.parquet"
+FILTER_COLS = ("act_date", "region", "Zone", "Channel")
+GROUP_COLS = FILTER_COLS
+SEGMENT_COLS = ("region", "Zone", "Channel")
+NO_ROWS = np.empty(0, dtype=np.intp)
+DATA_POLL_SECONDS = 30
+HOUR_LABELS = tuple(f"{(i%12 or 12)} {'AM' if i < 12 else 'PM'}" for i in range(24))
 IST = ZoneInfo("Asia/Kolkata")
 
 def _parse_hour_index(col: str) -> int:
     m = re.search(r"(\d+)", str(col))
     return int(m.group(1)) if m else 9999
 
-def load_data():
-    df = pd.read_csv(DATA_FILE)
+def _hour_columns(columns):
+    hour_cols = [c for c in columns if str(c).lower().startswith("h")]
+    return sorted(hour_cols, key=_parse_hour_index)
+
+def _read_csv(path, columns=None):
+    usecols = None if columns is None else (lambda c: c in columns)
+    df = pd.read_csv(path, usecols=usecols)
 
     # Expected: act_date, region, Zone (optional but recommended), Channel, h0..h23 (or similar)
     df["act_date"] = pd.to_datetime(df["act_date"], dayfirst=True, errors="coerce")
 
-    hour_cols = [c for c in df.columns if str(c).lower().startswith("h")]
-    hour_cols = sorted(hour_cols, key=_parse_hour_index)
+    hour_cols = _hour_columns(df.columns)
 
-    # Make hours numeric and safe
+    # Make hours numeric and safe; float32 halves the bytes the hourly sums stream through
     if hour_cols:
-        df[hour_cols] = df[hour_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
+        df[hour_cols] = df[hour_cols].apply(pd.to_numeric, errors="coerce").fillna(0).astype(np.float32)
+
+    return df, hour_cols
+
+def convert_to_parquet(csv_path=DATA_FILE, parquet_path=DATA_FILE_PARQ):
+    """
+    One-time conversion of the raw CSV into a typed Parquet file
+    (dates parsed, hours numeric) so the app can skip CSV parsing.
+    Also writes the per-segment hour sums as a float32 .npy plus a
+    keys-only Parquet file, which the app memory-maps instead of regrouping.
+    """
+    df, hour_cols = _read_csv(csv_path)
+    # Same rows as the loader keeps: an unparseable date can never match a selected day
+    df = df[df["act_date"].notna()]
+
+    hours_path, meta_path = _side_files(parquet_path)
+    agg = _aggregate(df, hour_cols)
+    _write_atomic(hours_path, lambda tmp: np.save(tmp, agg.to_numpy(np.float32)))
+    meta = agg.index.to_frame(index=False)
+    _write_atomic(meta_path, lambda tmp: meta.to_parquet(tmp, engine="pyarrow", index=False))
+
+    # Published last: once a worker switches to this Parquet version, its side files are already in place
+    _write_atomic(parquet_path, lambda tmp: df.to_parquet(tmp, engine="pyarrow", index=False))
+
+def _side_files(parquet_path):
+    # Converted per-segment hour block (memory-mapped) and its (date, region, Zone, Channel) keys
+    root = os.path.splitext(parquet_path)[0]
+    return f"{root}.hours.npy", f"{root}.meta.parquet"
+
+def _write_atomic(path, write):
+    # Write next to the target and rename over it: running workers that have the
+    # old file memory-mapped keep its inode instead of seeing it rewritten under them
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp-{os.getpid()}{ext}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _is_fresh(path, mtime):
+    return os.path.exists(path) and os.stat(path).st_mtime_ns >= mtime
+
+def _data_source():
+    # Prefer the Parquet copy, unless the CSV has been updated since conversion
+    csv_mtime = os.stat(DATA_FILE).st_mtime_ns
+    if os.path.exists(DATA_FILE_PARQ):
+        parq_mtime = os.stat(DATA_FILE_PARQ).st_mtime_ns
+        if parq_mtime >= csv_mtime:
+            return DATA_FILE_PARQ, parq_mtime
+    return DATA_FILE, csv_mtime
+
+_watcher_lock = threading.Lock()
+_watcher_started = False
+
+def _watch_data_file(source):
+    # Poll in the background so requests never stat the data files themselves
+    while True:
+        time.sleep(DATA_POLL_SECONDS)
+        try:
+            current = _data_source()
+        except OSError:
+            # File is mid-replace (non-atomic copy); look again on the next poll
+            continue
+        if current != source:
+            source = current
+            _get_dataset.cache_clear()
+
+def _start_watcher(source):
+    global _watcher_started
+    # functools.cache doesn't serialise concurrent misses: make sure only one watcher runs
+    with _watcher_lock:
+        if _watcher_started:
+            return
+        _watcher_started = True
+    threading.Thread(target=_watch_data_file, args=(source,), daemon=True).start()
+
+@functools.cache
+def _get_dataset():
+    """
+    Data file version (path, mtime) used by this process. Resolved once;
+    a watcher thread clears it when the file changes, so the next request
+    picks up the new version from the loaders' caches.
+    """
+    source = _data_source()
+    _start_watcher(source)
+    return source
+
+def _reset_after_fork():
+    # Forked workers inherit the cache but not the watcher thread: re-resolve in the child
+    global _watcher_lock, _watcher_started
+    _watcher_lock = threading.Lock()
+    _watcher_started = False
+    _get_dataset.cache_clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+@functools.lru_cache(maxsize=4)
+def _load_cached(path, mtime, columns):
+    # mtime is only part of the cache key: a rewritten file gets a fresh parse
+    if path.endswith(".parquet"):
+        if columns is not None:
+            available = pq.read_schema(path).names
+            columns = [c for c in columns if c in available]
+        # Dates and hours are already typed in the Parquet file
+        df = pd.read_parquet(path, columns=columns, engine="pyarrow")
+        hour_cols = _hour_columns(df.columns)
+        # Files converted before hours were stored as float32
+        if hour_cols:
+            df[hour_cols] = df[hour_cols].astype(np.float32, copy=False)
+    else:
+        df, hour_cols = _read_csv(path, columns)
+
+    # Sorted DatetimeIndex: date lookups are searchsorted slices, not column scans.
+    # Rows with an unparseable date can never match a selected day, so they are dropped here.
+    df = df[df["act_date"].notna()]
+    df = df.sort_values("act_date", kind="stable").set_index("act_date")
+
+    # Categorical segments store small integer codes instead of strings
+    for col in SEGMENT_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
 
     return df, hour_cols
 
-def cumulative(df, hour_cols):
-    if df.empty or not hour_cols:
-        return [0] * 24
-    v = df[hour_cols].sum().cumsum().tolist()
-    if len(v) < 24:
-        return v + [v[-1]] * (24 - len(v))
-    return v[:24]
+def _row_index(values):
+    """Map each distinct value to the sorted row positions holding it (missing values are left out)."""
+    cat = pd.Categorical(values)
+    codes = np.asarray(cat.codes)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(cat.categories) + 1))
+    return {
+        value: order[bounds[code]:bounds[code + 1]]
+        for code, value in enumerate(cat.categories)
+    }
+
+def _select(row_index, values):
+    # Union of the row positions for the selected values
+    parts = [row_index[v] for v in values if v in row_index]
+    return functools.reduce(np.union1d, parts) if parts else NO_ROWS
+
+def _narrow(rows, row_index, values):
+    # rows=None stands for "all rows"
+    selected = _select(row_index, values)
+    return selected if rows is None else np.intersect1d(rows, selected, assume_unique=True)
+
+@functools.lru_cache(maxsize=4)
+def _filter_index_cached(path, mtime):
+    df, _ = _load_cached(path, mtime, FILTER_COLS)
+    return df, {col: _row_index(df[col]) for col in SEGMENT_COLS if col in df.columns}
+
+def load_data(columns=None):
+    # Cached per file version and column set; routes only filter, never mutate the frame
+    path, mtime = _get_dataset()
+    return _load_cached(path, mtime, tuple(columns) if columns is not None else None)
+
+def _aggregate(df, hour_cols):
+    # act_date is the index of loaded frames but a plain column straight from the CSV
+    keys = [c for c in GROUP_COLS if c in df.columns or c in df.index.names]
+    # One row per (date, region, zone, channel): requests reduce this instead of raw rows.
+    # dropna=False keeps rows with missing segment values, as the raw-row sums did.
+    agg = df.groupby(keys, sort=False, observed=True, dropna=False)[hour_cols].sum().astype(np.float32)
+    # Date-ordered rows so any date window is one contiguous searchsorted slice
+    return agg.sort_index(level="act_date", sort_remaining=False)
+
+@functools.lru_cache(maxsize=4)
+def _agg_cached(path, mtime):
+    hours_path, meta_path = _side_files(path)
+    # Side files are written before the Parquet file, so they only need to postdate the CSV
+    csv_mtime = os.stat(DATA_FILE).st_mtime_ns
+    if path.endswith(".parquet") and _is_fresh(hours_path, csv_mtime) and _is_fresh(meta_path, csv_mtime):
+        # Converted layout: the OS page cache serves the hour block, only gathered rows are read
+        index = pd.MultiIndex.from_frame(pd.read_parquet(meta_path, engine="pyarrow"))
+        hours = np.load(hours_path, mmap_mode="r")
+    else:
+        df, hour_cols = _load_cached(path, mtime, None)
+        agg = _aggregate(df, hour_cols)
+        index = agg.index
+        # Contiguous hour matrix aligned with agg rows; routes gather rows by position
+        hours = np.ascontiguousarray(agg.to_numpy(np.float32))
+    dates = index.get_level_values("act_date").to_numpy()
+    row_index = {name: _row_index(index.get_level_values(name)) for name in SEGMENT_COLS if name in index.names}
+    return row_index, dates, hours
+
+def load_filter_index():
+    path, mtime = _get_dataset()
+    return _filter_index_cached(path, mtime)
+
+def warm_cache():
+    """
+    Load every cached view of the dataset up front (run in the gunicorn parent
+    before forking). Goes to the loaders directly so the parent never starts
+    a watcher thread; each worker starts its own on its first request.
+    """
+    path, mtime = _data_source()
+    _load_cached(path, mtime, ("act_date",))
+    _filter_index_cached(path, mtime)
+    _, _, hours = _agg_cached(path, mtime)
+    # Compile the kernel for this hour block's array type so workers don't each JIT it
+    _sum_by_day(hours, NO_ROWS, np.empty(0, dtype=np.int64), 8)
+
+def _parse_date(date_str):
+    """Parse the ?date= argument (YYYY-MM-DD from the date picker) to midnight; None if invalid."""
+    try:
+        return pd.Timestamp(datetime.strptime(date_str, "%Y-%m-%d"))
+    except ValueError:
+        pass
+    sel_date = pd.to_datetime(date_str, errors="coerce")
+    # Day buckets in _compute are counted from midnight, so drop any time of day
+    return None if pd.isna(sel_date) else sel_date.normalize()
+
+@njit(cache=True)
+def _sum_by_day(hours, rows, day_of_row, n_days):
+    # One pass over the selected rows, accumulating each into its day's totals
+    n_cols = hours.shape[1]
+    out = np.zeros((n_days, n_cols))
+    for k in range(rows.size):
+        r = rows[k]
+        d = day_of_row[k]
+        for j in range(n_cols):
+            out[d, j] += hours[r, j]
+    return out
+
+def cumulative(totals, divisor=1):
+    """Cumulative curve (length 24, float64) from per-hour totals, divided by divisor."""
+    if totals.size == 0:
+        return np.zeros(24)
+    out = np.cumsum(totals / divisor)
+    if out.size < 24:
+        return np.concatenate([out, np.full(24 - out.size, out[-1])])
+    return out[:24]
 
 def calculate_projection(prev_curve, last7_curve, current_hour, current_value):
     """
@@ -41,31 +283,36 @@ def calculate_projection(prev_curve, last7_curve, current_hour, current_value):
     - 50% previous day curve growth
     - 50% last 7 days avg curve growth
     Anchored to *today's* current cumulative value (current_value).
+    Returns a length-24 float array with NaN for hours that are not projected.
     """
-    projection = [None] * 24
     if current_hour is None or current_hour >= 23:
-        return projection
+        return np.full(24, np.nan)
     if current_value is None:
-        return projection
+        return np.full(24, np.nan)
 
     # Ensure lengths
-    prev_curve = (prev_curve or [0]*24)[:24]
-    last7_curve = (last7_curve or [0]*24)[:24]
+    prev_curve = np.zeros(24) if prev_curve is None else np.asarray(prev_curve, dtype=np.float64)[:24]
+    last7_curve = np.zeros(24) if last7_curve is None else np.asarray(last7_curve, dtype=np.float64)[:24]
 
     base_prev = prev_curve[current_hour]
     base_last7 = last7_curve[current_hour]
 
-    for i in range(current_hour + 1, 24):
-        prev_growth = prev_curve[i] - base_prev
-        last7_growth = last7_curve[i] - base_last7
-        projection[i] = current_value + (0.5 * prev_growth) + (0.5 * last7_growth)
-
+    projection = np.full(24, np.nan)
+    future = slice(current_hour + 1, 24)
+    projection[future] = (
+        current_value
+        + 0.5 * (prev_curve[future] - base_prev)
+        + 0.5 * (last7_curve[future] - base_last7)
+    )
     return projection
 
+def _nan_to_none(values):
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
 @app.route("/")
 def home():
-    df, _ = load_data()
-    max_date = df["act_date"].max()
+    df, _ = load_data(["act_date"])
+    max_date = df.index.max()
     if pd.isna(max_date):
         max_date = datetime.now(IST)
     return render_template("FT.html", max_date=max_date.strftime("%Y-%m-%d"))
@@ -79,52 +326,56 @@ def filters():
       - Regions list: dependent on selected zone(s).
       - Channels list: dependent on selected zone(s) + region(s).
     """
-    df, _ = load_data()
+    df, row_index = load_filter_index()
 
-    date_str = request.args.get("date", "")
-    sel_date = pd.to_datetime(date_str, errors="coerce")
-    if pd.isna(sel_date):
+    sel_date = _parse_date(request.args.get("date", ""))
+    if sel_date is None:
         return jsonify({"zones": [], "regions": [], "channels": []})
 
     # Narrow to selected day only
-    df_day = df[df["act_date"] == sel_date].copy()
+    lo, hi = df.index.slice_locs(sel_date, sel_date)
+    day_rows = np.arange(lo, hi)
 
     zones_selected = request.args.getlist("zone") or []
     regions_selected = request.args.getlist("region") or []
 
-    zone_col = "Zone" if "Zone" in df_day.columns else None
+    zone_col = "Zone" if "Zone" in df.columns else None
     region_col = "region"
     channel_col = "Channel"
 
     # If columns missing, still respond safely
-    if region_col not in df_day.columns:
+    if region_col not in df.columns:
         return jsonify({"zones": [], "regions": [], "channels": []})
-    if channel_col not in df_day.columns:
-        df_day[channel_col] = None
+
+    def values_at(col, rows):
+        return sorted(df[col].take(rows).dropna().astype(str).unique().tolist())
 
     # ---- Build ZONES (exist for date; optionally restrict by selected regions) ----
     if zone_col:
-        df_for_zones = df_day
+        rows_for_zones = day_rows
         # bidirectional: if user selected regions (even without zone), show only zones that have those regions
         if regions_selected:
-            df_for_zones = df_for_zones[df_for_zones[region_col].isin(regions_selected)]
-        zones = sorted(df_for_zones[zone_col].dropna().astype(str).unique().tolist())
+            rows_for_zones = _narrow(rows_for_zones, row_index[region_col], regions_selected)
+        zones = values_at(zone_col, rows_for_zones)
     else:
         zones = []
 
     # ---- Build REGIONS (dependent on selected zones) ----
-    df_for_regions = df_day
+    rows_for_regions = day_rows
     if zone_col and zones_selected:
-        df_for_regions = df_for_regions[df_for_regions[zone_col].isin(zones_selected)]
-    regions = sorted(df_for_regions[region_col].dropna().astype(str).unique().tolist())
+        rows_for_regions = _narrow(rows_for_regions, row_index[zone_col], zones_selected)
+    regions = values_at(region_col, rows_for_regions)
 
     # ---- Build CHANNELS (dependent on selected zones + selected regions) ----
-    df_for_channels = df_day
-    if zone_col and zones_selected:
-        df_for_channels = df_for_channels[df_for_channels[zone_col].isin(zones_selected)]
-    if regions_selected:
-        df_for_channels = df_for_channels[df_for_channels[region_col].isin(regions_selected)]
-    channels = sorted(df_for_channels[channel_col].dropna().astype(str).unique().tolist())
+    if channel_col in df.columns:
+        rows_for_channels = day_rows
+        if zone_col and zones_selected:
+            rows_for_channels = _narrow(rows_for_channels, row_index[zone_col], zones_selected)
+        if regions_selected:
+            rows_for_channels = _narrow(rows_for_channels, row_index[region_col], regions_selected)
+        channels = values_at(channel_col, rows_for_channels)
+    else:
+        channels = []
 
     return jsonify({
         "zones": zones,
@@ -132,64 +383,74 @@ def filters():
         "channels": channels
     })
 
-@app.route("/chart-data")
-def chart_data():
-    df, hour_cols = load_data()
-
-    date_str = request.args.get("date", "")
-    sel_date = pd.to_datetime(date_str, errors="coerce")
-    if pd.isna(sel_date):
-        return jsonify({"error": "Invalid date"}), 400
+def _chart_etag(source, sel_date, regions, zones, channels, current_hour):
+    # Same data version, selection and live hour => same payload
+    key = repr((source, sel_date.isoformat(), regions, zones, channels, current_hour))
+    return hashlib.sha1(key.encode()).hexdigest()
 
-    regions = request.args.getlist("region")
-    zones = request.args.getlist("zone")
-    channels = request.args.getlist("channel")
+@functools.lru_cache(maxsize=256)
+def _compute(source, sel_date, regions, zones, channels):
+    """
+    Cumulative (base, prev, last7) curves for a date and filter combination.
+    Keyed on the data version too, so a reload never serves stale curves.
+    """
+    row_index, dates, hours = _agg_cached(*source)
 
     # Apply filters across all dates (so prev/last7 also match same segment)
+    segment = None
     if regions:
-        df = df[df["region"].isin(regions)]
-    if zones and "Zone" in df.columns:
-        df = df[df["Zone"].isin(zones)]
-    if channels and "Channel" in df.columns:
-        df = df[df["Channel"].isin(channels)]
+        segment = _narrow(segment, row_index["region"], regions)
+    if zones and "Zone" in row_index:
+        segment = _narrow(segment, row_index["Zone"], zones)
+    if channels and "Channel" in row_index:
+        segment = _narrow(segment, row_index["Channel"], channels)
+
+    # Single scan over the whole window: day 0..6 is last7, day 6 is prev, day 7 is the selected date
+    start = np.datetime64(sel_date - timedelta(days=7))
+    lo = np.searchsorted(dates, start, side="left")
+    hi = np.searchsorted(dates, np.datetime64(sel_date), side="right")
+    rows = np.arange(lo, hi)
+    if segment is not None:
+        rows = np.intersect1d(rows, segment, assume_unique=True)
+    day_of_row = (dates[rows] - start) // np.timedelta64(1, "D")
+    by_day = _sum_by_day(hours, rows, day_of_row, 8)
+
+    base_raw = cumulative(by_day[7])
+    prev_curve = cumulative(by_day[6])
+
+    n_last7 = np.unique(day_of_row[day_of_row < 7]).size
+    last7_curve = cumulative(by_day[:7].sum(axis=0), max(n_last7, 1))
+
+    # Shared between requests through the cache
+    for curve in (base_raw, prev_curve, last7_curve):
+        curve.setflags(write=False)
+    return base_raw, prev_curve, last7_curve
+
+def _chart_payload(source, sel_date, regions, zones, channels, current_hour):
+    # Curves come from the per-combination cache; only the live-hour parts are rebuilt here
+    base_raw, prev_curve, last7_curve = _compute(source, sel_date, regions, zones, channels)
 
     prev = sel_date - timedelta(days=1)
     last7_start = sel_date - timedelta(days=7)
     last7_end = sel_date - timedelta(days=1)
 
-    base_raw = cumulative(df[df["act_date"] == sel_date], hour_cols)
-    prev_curve = cumulative(df[df["act_date"] == prev], hour_cols)
-
-    last7_df = df[(df["act_date"] >= last7_start) & (df["act_date"] <= last7_end)]
-    if not last7_df.empty and hour_cols:
-        avg = last7_df[hour_cols].sum() / max(last7_df["act_date"].nunique(), 1)
-        last7_curve = avg.cumsum().tolist()
-        if len(last7_curve) < 24:
-            last7_curve = last7_curve + [last7_curve[-1]] * (24 - len(last7_curve))
-        last7_curve = last7_curve[:24]
-    else:
-        last7_curve = [0] * 24
-
-    now = datetime.now(IST)
-    current_hour = now.hour if sel_date.date() == now.date() else None
-
     # Show actuals only until current hour for selected day
     base_curve = [
-        base_raw[i] if current_hour is None or i <= current_hour else None
-        for i in range(24)
+        v if current_hour is None or i <= current_hour else None
+        for i, v in enumerate(base_raw.tolist())
     ]
 
-    current_value = base_raw[current_hour] if current_hour is not None else None
+    current_value = float(base_raw[current_hour]) if current_hour is not None else None
     projected_curve = calculate_projection(prev_curve, last7_curve, current_hour, current_value)
 
     live_point = current_value
 
-    return jsonify({
-        "labels": [f"{(i%12 or 12)} {'AM' if i < 12 else 'PM'}" for i in range(24)],
+    return {
+        "labels": HOUR_LABELS,
         "base": base_curve,
-        "prev": prev_curve,
-        "last7": last7_curve,
-        "projected": projected_curve,
+        "prev": prev_curve.tolist(),
+        "last7": last7_curve.tolist(),
+        "projected": _nan_to_none(projected_curve),
         "current_hour": current_hour,
         "live_point": live_point,
         "dates": {
@@ -197,8 +458,36 @@ def chart_data():
             "prev": prev.strftime("%d-%b-%Y"),
             "last7": f"{last7_start.strftime('%d-%b-%Y')} → {last7_end.strftime('%d-%b-%Y')}"
         },
-        "last_refresh": now.strftime("%d-%b-%Y %I:%M:%S %p")
-    })
+    }
+
+@app.route("/chart-data")
+def chart_data():
+    sel_date = _parse_date(request.args.get("date", ""))
+    if sel_date is None:
+        return jsonify({"error": "Invalid date"}), 400
+
+    # Filter order doesn't change the result; normalise so repeat polls share an ETag and cache entry
+    regions = tuple(sorted(request.args.getlist("region")))
+    zones = tuple(sorted(request.args.getlist("zone")))
+    channels = tuple(sorted(request.args.getlist("channel")))
+
+    now = datetime.now(IST)
+    current_hour = now.hour if sel_date.date() == now.date() else None
+
+    source = _get_dataset()
+    etag = _chart_etag(source, sel_date, regions, zones, channels, current_hour)
+    if etag in request.if_none_match:
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify(_chart_payload(source, sel_date, regions, zones, channels, current_hour))
+    resp.set_etag(etag)
+    # Let the browser keep the body but revalidate on every poll
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    if sys.argv[1:] == ["convert"]:
+        convert_to_parquet()
+    else:
+        # Local development only; production runs under gunicorn (see gunicorn.conf.py)
+        app.run(debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -0,0 +1,12 @@
+# Production server: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+
+# Import the app once in the parent so workers share the loaded dataset copy-on-write
+preload_app = True
+
+def on_starting(server):
+    from app import warm_cache
+    warm_cache()